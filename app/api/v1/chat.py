@@ -1,8 +1,8 @@
 """聊天API路由 - OpenAI兼容的聊天接口"""
 
 from fastapi import APIRouter, Depends, HTTPException
-from typing import Optional
-from fastapi.responses import StreamingResponse
+from typing import Any, Awaitable, Optional
+from fastapi.responses import ORJSONResponse, StreamingResponse
 
 from app.core.auth import auth_manager
 from app.core.exception import GrokApiException
@@ -14,36 +14,15 @@ from app.models.openai_schema import OpenAIChatRequest
 router = APIRouter(prefix="/chat", tags=["聊天"])
 
 
-@router.post("/completions", response_model=None)
-async def chat_completions(request: OpenAIChatRequest, _: Optional[str] = Depends(auth_manager.verify)):
-    """创建聊天补全（支持流式和非流式）"""
-    logger.info("[Chat] 收到聊天请求")
-
+async def _run_and_convert(coro: Awaitable[Any]) -> Any:
+    """执行请求，并将非业务异常转换为500错误"""
     try:
-        # 调用Grok客户端
-        result = await GrokClient.openai_to_grok(request.model_dump())
-
-        # 流式响应
-        if request.stream:
-            return StreamingResponse(
-                content=result,
-                media_type="text/event-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "X-Accel-Buffering": "no"
-                }
-            )
-
-        # 非流式响应
-        return result
-
+        return await coro
+    except (GrokApiException, HTTPException):
+        # 交给全局异常处理器处理
+        raise
     except Exception as e:
-        if isinstance(e, GrokApiException):
-            # 交给全局异常处理器处理
-            raise
-
-        logger.error(f"[Chat] 处理失败: {e}")
+        logger.error("[Chat] 处理失败: %s", e)
         raise HTTPException(
             status_code=500,
             detail={
@@ -54,3 +33,27 @@ async def chat_completions(request: OpenAIChatRequest, _: Optional[str] = Depend
                 }
             }
         )
+
+
+@router.post("/completions", response_model=None)
+async def chat_completions(request: OpenAIChatRequest, _: Optional[str] = Depends(auth_manager.verify)):
+    """创建聊天补全（支持流式和非流式）"""
+    logger.info("[Chat] 收到聊天请求")
+
+    # 流式响应（上游请求延迟到首次迭代时发起；此前先做无上游预检，失败仍返回对应状态码）
+    if request.stream:
+        token = await _run_and_convert(GrokClient.check_stream_ready(request))
+        return StreamingResponse(
+            content=GrokClient.stream_openai_to_grok(request, token),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache, no-transform",
+                "Connection": "keep-alive",
+                "Content-Encoding": "identity",
+                "X-Accel-Buffering": "no"
+            }
+        )
+
+    # 非流式响应（直接由orjson序列化，跳过jsonable_encoder遍历）
+    result = await _run_and_convert(GrokClient.openai_to_grok(request))
+    return ORJSONResponse(content=result.model_dump())
@@ -1,5 +1,6 @@
 """认证模块 - API令牌验证"""
 
+import hmac
 from typing import Optional
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -23,40 +24,36 @@ def _build_error(message: str, code: str = "invalid_token") -> dict:
     }
 
 
+# 预构建的认证错误（只读，所有请求共享）
+_ERR_AUTH_NOT_CONFIGURED = _build_error("服务未配置认证密钥，请联系管理员", "auth_not_configured")
+_ERR_MISSING_TOKEN = _build_error("缺少认证令牌", "missing_token")
+_ERR_INVALID_TOKEN = _build_error("令牌无效", "invalid_token")
+
+
 class AuthManager:
     """认证管理器 - 验证API令牌"""
 
     @staticmethod
     def verify(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> Optional[str]:
         """验证令牌（Fail Closed）"""
-        api_key = setting.grok_config.get("api_key")
-        allow_anonymous = setting.grok_config.get("allow_anonymous_access", False)
+        api_key = setting.api_key_bytes
 
         # 未设置 API_KEY 时的安全策略
         if not api_key:
-            if allow_anonymous:
+            if setting.allow_anonymous:
                 logger.warning("[Auth] 匿名访问已启用（安全风险）")
                 return credentials.credentials if credentials else None
             else:
                 logger.error("[Auth] API_KEY 未配置且未启用匿名访问，拒绝请求（Fail Closed）")
-                raise HTTPException(
-                    status_code=401,
-                    detail=_build_error("服务未配置认证密钥，请联系管理员", "auth_not_configured")
-                )
+                raise HTTPException(status_code=401, detail=_ERR_AUTH_NOT_CONFIGURED)
 
         # 检查令牌
         if not credentials:
-            raise HTTPException(
-                status_code=401,
-                detail=_build_error("缺少认证令牌", "missing_token")
-            )
-
-        # 验证令牌
-        if credentials.credentials != api_key:
-            raise HTTPException(
-                status_code=401,
-                detail=_build_error(f"令牌无效，长度: {len(credentials.credentials)}", "invalid_token")
-            )
+            raise HTTPException(status_code=401, detail=_ERR_MISSING_TOKEN)
+
+        # 验证令牌（常量时间比较，避免时序侧信道）
+        if not hmac.compare_digest(credentials.credentials.encode("utf-8", "ignore"), api_key):
+            raise HTTPException(status_code=401, detail=_ERR_INVALID_TOKEN)
 
         logger.debug("[Auth] 令牌认证成功")
         return credentials.credentials
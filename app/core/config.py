@@ -1,8 +1,19 @@
 """配置管理器 - 管理应用配置的读写"""
 
-import toml
+import re
+import copy
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python 3.10
+    import tomli as tomllib
+
+try:
+    import rtoml as toml_writer
+except ImportError:
+    import toml as toml_writer
 from pathlib import Path
-from typing import Dict, Any, Optional, Literal
+from typing import Callable, Dict, Any, List, Optional, Literal, Tuple
 
 
 # 默认配置
@@ -17,6 +28,7 @@ DEFAULT_GROK = {
     "stream_chunk_timeout": 120,
     "stream_total_timeout": 600,
     "stream_first_response_timeout": 30,
+    "stream_coalesce_ms": 3,
     "temporary": True,
     "show_thinking": True
 }
@@ -25,6 +37,33 @@ DEFAULT_GLOBAL = {
     "log_level": "INFO"
 }
 
+# TOML解析缓存 {路径: (mtime_ns, size, 解析结果)}
+_toml_cache: Dict[Path, Tuple[int, int, Dict[str, Any]]] = {}
+
+
+def load_toml(path: Path) -> Dict[str, Any]:
+    """读取TOML文件（按mtime+size缓存解析结果，返回副本）"""
+    stat = path.stat()
+    cached = _toml_cache.get(path)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return copy.deepcopy(cached[2])
+
+    data = tomllib.loads(path.read_text(encoding="utf-8"))
+    _toml_cache[path] = (stat.st_mtime_ns, stat.st_size, data)
+    return copy.deepcopy(data)
+
+
+def dump_toml(data: Dict[str, Any]) -> str:
+    """序列化为TOML文本（None值的键直接省略，与toml库行为一致）"""
+    if toml_writer.__name__ == "rtoml":
+        return toml_writer.dumps(data, none_value=None)
+    return toml_writer.dumps(data)
+
+
+def invalidate_toml(path: Path) -> None:
+    """使TOML缓存失效"""
+    _toml_cache.pop(path, None)
+
 
 class ConfigManager:
     """配置管理器"""
@@ -36,6 +75,7 @@ class ConfigManager:
         self._ensure_exists()
         self.global_config: Dict[str, Any] = self.load("global")
         self.grok_config: Dict[str, Any] = self.load("grok")
+        self._update_cache()
     
     def _ensure_exists(self) -> None:
         """确保配置存在"""
@@ -46,60 +86,90 @@ class ConfigManager:
     def _create_default(self) -> None:
         """创建默认配置"""
         default = {"grok": DEFAULT_GROK.copy(), "global": DEFAULT_GLOBAL.copy()}
-        with open(self.config_path, "w", encoding="utf-8") as f:
-            toml.dump(default, f)
+        self.config_path.write_text(dump_toml(default), encoding="utf-8")
+        invalidate_toml(self.config_path)
     
-    def _normalize_proxy(self, proxy: str) -> str:
-        """标准化代理URL（socks5:// → socks5h://）"""
+    def _normalize_grok(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """标准化Grok配置（原地修改，仅在需要时重写）"""
+        # 代理URL: socks5:// → socks5h://
+        proxy = config.get("proxy_url")
         if proxy and proxy.startswith("socks5://"):
-            return proxy.replace("socks5://", "socks5h://", 1)
-        return proxy
-    
-    def _normalize_cf(self, cf: str) -> str:
-        """标准化CF Clearance（自动添加前缀）"""
+            config["proxy_url"] = "socks5h://" + proxy[len("socks5://"):]
+
+        # CF Clearance: 自动添加前缀
+        cf = config.get("cf_clearance")
         if cf and not cf.startswith("cf_clearance="):
-            return f"cf_clearance={cf}"
-        return cf
+            config["cf_clearance"] = f"cf_clearance={cf}"
+        return config
+
+    def _update_cache(self) -> None:
+        """更新派生配置缓存（热路径直接读取属性）"""
+        self.api_key: Optional[str] = self.grok_config.get("api_key") or None
+        self.api_key_bytes: Optional[bytes] = self.api_key.encode() if self.api_key else None
+        self.allow_anonymous: bool = bool(self.grok_config.get("allow_anonymous_access", False))
+
+        # 流式处理参数（每个流式请求读取，配置变更时重新解析）
+        grok = self.grok_config
+        raw_tags = grok.get("filtered_tags", "")
+        if isinstance(raw_tags, str):
+            raw_tags = raw_tags.split(",")
+        self.filtered_tags: List[str] = [str(tag).strip() for tag in raw_tags if str(tag).strip()]
+        self.tag_matcher: Optional[Callable[[str], Any]] = (
+            re.compile("|".join(map(re.escape, self.filtered_tags))).search if self.filtered_tags else None
+        )
+        self.show_thinking: bool = bool(grok.get("show_thinking", True))
+        self.stream_timeouts: Tuple[int, int, int] = (
+            grok.get("stream_chunk_timeout", 120),
+            grok.get("stream_first_response_timeout", 30),
+            grok.get("stream_total_timeout", 600),
+        )
+        self.stream_coalesce_window: float = max(grok.get("stream_coalesce_ms", 3), 0) / 1000
 
     def set_storage(self, storage: Any) -> None:
         """设置存储实例"""
         self._storage = storage
 
+    def _section(self, config: Dict[str, Any], section: Literal["global", "grok"]) -> Dict[str, Any]:
+        """提取配置节（Grok配置同时标准化）"""
+        data = config[section]
+        if section == "grok":
+            self._normalize_grok(data)
+        return data
+
     def load(self, section: Literal["global", "grok"]) -> Dict[str, Any]:
-        """加载配置节"""
+        """加载配置节（同步读取，仅用于启动阶段）"""
         try:
-            with open(self.config_path, "r", encoding="utf-8") as f:
-                config = toml.load(f)[section]
-
-            # 标准化Grok配置
-            if section == "grok":
-                if "proxy_url" in config:
-                    config["proxy_url"] = self._normalize_proxy(config["proxy_url"])
-                if "cf_clearance" in config:
-                    config["cf_clearance"] = self._normalize_cf(config["cf_clearance"])
-
-            return config
+            return self._section(load_toml(self.config_path), section)
         except Exception as e:
             raise Exception(f"[Setting] 配置加载失败: {e}") from e
     
     async def reload(self) -> None:
-        """重新加载配置"""
-        self.global_config = self.load("global")
-        self.grok_config = self.load("grok")
+        """重新加载配置（文件IO在线程池中完成）"""
+        from app.core.storage import read_toml
+
+        try:
+            config = await read_toml(self.config_path)
+            global_config = self._section(config, "global")
+            grok_config = self._section(config, "grok")
+        except Exception as e:
+            raise Exception(f"[Setting] 配置加载失败: {e}") from e
+
+        self.global_config = global_config
+        self.grok_config = grok_config
+        self._update_cache()
     
     async def _save_file(self, updates: Dict[str, Dict[str, Any]]) -> None:
         """保存到文件"""
-        import aiofiles
+        from app.core.storage import read_toml, write_file
         
-        async with aiofiles.open(self.config_path, "r", encoding="utf-8") as f:
-            config = toml.loads(await f.read())
+        config = await read_toml(self.config_path)
         
         for section, data in updates.items():
             if section in config:
                 config[section].update(data)
         
-        async with aiofiles.open(self.config_path, "w", encoding="utf-8") as f:
-            await f.write(toml.dumps(config))
+        await write_file(self.config_path, dump_toml(config))
+        invalidate_toml(self.config_path)
     
     async def _save_storage(self, updates: Dict[str, Dict[str, Any]]) -> None:
         """保存到存储"""
@@ -112,13 +182,11 @@ class ConfigManager:
         await self._storage.save_config(config)
     
     def _prepare_grok(self, grok: Dict[str, Any]) -> Dict[str, Any]:
-        """准备Grok配置（移除前缀）"""
-        processed = grok.copy()
-        if "cf_clearance" in processed:
-            cf = processed["cf_clearance"]
-            if cf and cf.startswith("cf_clearance="):
-                processed["cf_clearance"] = cf.replace("cf_clearance=", "", 1)
-        return processed
+        """准备Grok配置（移除前缀，无需处理时原样返回）"""
+        cf = grok.get("cf_clearance")
+        if cf and cf.startswith("cf_clearance="):
+            return {**grok, "cf_clearance": cf[len("cf_clearance="):]}
+        return grok
 
     async def save(self, global_config: Optional[Dict[str, Any]] = None, grok_config: Optional[Dict[str, Any]] = None) -> None:
         """保存配置"""
@@ -135,7 +203,12 @@ class ConfigManager:
         else:
             await self._save_file(updates)
         
-        await self.reload()
+        # 直接合并到内存配置，无需重新读取文件
+        if global_config:
+            self.global_config.update(global_config)
+        if grok_config:
+            self.grok_config.update(self._normalize_grok(dict(grok_config)))
+        self._update_cache()
     
     def get_proxy(self) -> str:
         """获取服务代理URL"""
@@ -1,9 +1,11 @@
 """全局日志模块 - 单例模式的日志管理器"""
 
+import os
 import sys
+import queue
 import logging
 from pathlib import Path
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 from app.core.config import setting
 
@@ -34,6 +36,14 @@ class LoggerManager:
         # 根日志器
         self.logger = logging.getLogger()
         self.logger.setLevel(log_level)
+        self._listener = None
+
+        # 直接绑定日志方法，调用时不经过额外的包装帧
+        self.debug = self.logger.debug
+        self.info = self.logger.info
+        self.warning = self.logger.warning
+        self.error = self.logger.error
+        self.critical = self.logger.critical
 
         # 避免重复添加
         if self.logger.handlers:
@@ -42,21 +52,26 @@ class LoggerManager:
         # 格式器
         formatter = logging.Formatter(log_format)
 
-        # 控制台处理器
-        console = logging.StreamHandler(sys.stdout)
-        console.setLevel(log_level)
-        console.setFormatter(formatter)
-
-        # 文件处理器（10MB，5个备份）
+        # 文件处理器（10MB，5个备份，首次写入时才打开文件）
         file_handler = RotatingFileHandler(
-            log_file, maxBytes=10*1024*1024, backupCount=5, encoding="utf-8"
+            log_file, maxBytes=10*1024*1024, backupCount=5, encoding="utf-8", delay=True
         )
         file_handler.setLevel(log_level)
         file_handler.setFormatter(formatter)
+        handlers = [file_handler]
 
-        # 添加处理器
-        self.logger.addHandler(console)
-        self.logger.addHandler(file_handler)
+        # 控制台处理器（仅DEBUG级别或设置DEV环境变量时启用）
+        if log_level == "DEBUG" or os.getenv("DEV"):
+            console = logging.StreamHandler(sys.stdout)
+            console.setLevel(log_level)
+            console.setFormatter(formatter)
+            handlers.append(console)
+
+        # 请求路径仅入队，控制台与文件IO由后台监听线程完成
+        log_queue = queue.SimpleQueue()
+        self.logger.addHandler(QueueHandler(log_queue))
+        self._listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        self._listener.start()
 
         # 配置第三方库
         self._configure_third_party()
@@ -74,25 +89,11 @@ class LoggerManager:
         for name, level in config.items():
             logging.getLogger(name).setLevel(level)
 
-    def debug(self, msg: str) -> None:
-        """调试日志"""
-        self.logger.debug(msg)
-
-    def info(self, msg: str) -> None:
-        """信息日志"""
-        self.logger.info(msg)
-
-    def warning(self, msg: str) -> None:
-        """警告日志"""
-        self.logger.warning(msg)
-
-    def error(self, msg: str) -> None:
-        """错误日志"""
-        self.logger.error(msg)
-
-    def critical(self, msg: str) -> None:
-        """严重错误日志"""
-        self.logger.critical(msg)
+    def close(self) -> None:
+        """停止后台日志线程（刷新队列中剩余日志）"""
+        if self._listener:
+            self._listener.stop()
+            self._listener = None
 
 
 # 全局实例
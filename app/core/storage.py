@@ -1,15 +1,50 @@
 """存储抽象层 - 仅支持文件存储"""
 
+import os
 import orjson
-import toml
 import asyncio
-import aiofiles
 from pathlib import Path
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Union
 
+from app.core.config import load_toml, dump_toml, invalidate_toml
 from app.core.logger import logger
 
 
+# 文件IO专用线程池（仅 token/配置两个小文件，避免占用默认线程池）
+_io_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="storage-io")
+
+
+def _read_file(path: Path) -> str:
+    """同步读取文件"""
+    return path.read_text(encoding="utf-8")
+
+
+def _write_file(path: Path, content: Union[str, bytes]) -> None:
+    """同步原子写入文件（先写临时文件再替换，bytes 原样写入）"""
+    tmp = path.with_name(f"{path.name}.tmp")
+    if isinstance(content, bytes):
+        tmp.write_bytes(content)
+    else:
+        tmp.write_text(content, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+async def read_file(path: Path) -> str:
+    """读取文件（整体提交到IO线程池执行一次）"""
+    return await asyncio.get_running_loop().run_in_executor(_io_executor, _read_file, path)
+
+
+async def write_file(path: Path, content: Union[str, bytes]) -> None:
+    """写入文件（整体提交到IO线程池执行一次）"""
+    await asyncio.get_running_loop().run_in_executor(_io_executor, _write_file, path, content)
+
+
+async def read_toml(path: Path) -> Dict[str, Any]:
+    """读取TOML（stat校验、读取与解析整体提交到IO线程池执行一次）"""
+    return await asyncio.get_running_loop().run_in_executor(_io_executor, load_toml, path)
+
+
 class FileStorage:
     """文件存储"""
 
@@ -25,7 +60,7 @@ class FileStorage:
         self.data_dir.mkdir(parents=True, exist_ok=True)
 
         if not self.token_file.exists():
-            await self._write(self.token_file, orjson.dumps({"sso": {}, "ssoSuper": {}}, option=orjson.OPT_INDENT_2).decode())
+            await self._write(self.token_file, orjson.dumps({"sso": {}, "ssoSuper": {}}, option=orjson.OPT_INDENT_2))
             logger.info("[Storage] 创建token文件")
 
         if not self.config_file.exists():
@@ -33,18 +68,17 @@ class FileStorage:
                 "global": {"api_keys": []},
                 "grok": {"proxy_url": "", "cf_clearance": "", "x_statsig_id": ""}
             }
-            await self._write(self.config_file, toml.dumps(default))
+            await self._write(self.config_file, dump_toml(default))
+            invalidate_toml(self.config_file)
             logger.info("[Storage] 创建配置文件")
 
     async def _read(self, path: Path) -> str:
         """读取文件"""
-        async with aiofiles.open(path, "r", encoding="utf-8") as f:
-            return await f.read()
+        return await read_file(path)
 
-    async def _write(self, path: Path, content: str) -> None:
+    async def _write(self, path: Path, content: Union[str, bytes]) -> None:
         """写入文件"""
-        async with aiofiles.open(path, "w", encoding="utf-8") as f:
-            await f.write(content)
+        await write_file(path, content)
 
     async def _load_json(self, path: Path, default: Dict, lock: asyncio.Lock) -> Dict[str, Any]:
         """加载JSON"""
@@ -52,7 +86,8 @@ class FileStorage:
             async with lock:
                 if not path.exists():
                     return default
-                return orjson.loads(await self._read(path))
+                content = await self._read(path)
+            return orjson.loads(content)
         except Exception as e:
             logger.error(f"[Storage] 加载{path.name}失败: {e}")
             return default
@@ -60,8 +95,9 @@ class FileStorage:
     async def _save_json(self, path: Path, data: Dict, lock: asyncio.Lock) -> None:
         """保存JSON"""
         try:
+            content = orjson.dumps(data, option=orjson.OPT_INDENT_2)
             async with lock:
-                await self._write(path, orjson.dumps(data, option=orjson.OPT_INDENT_2).decode())
+                await self._write(path, content)
         except Exception as e:
             logger.error(f"[Storage] 保存{path.name}失败: {e}")
             raise
@@ -72,7 +108,7 @@ class FileStorage:
             async with lock:
                 if not path.exists():
                     return default
-                return toml.loads(await self._read(path))
+                return await read_toml(path)
         except Exception as e:
             logger.error(f"[Storage] 加载{path.name}失败: {e}")
             return default
@@ -80,8 +116,10 @@ class FileStorage:
     async def _save_toml(self, path: Path, data: Dict, lock: asyncio.Lock) -> None:
         """保存TOML"""
         try:
+            content = dump_toml(data)
             async with lock:
-                await self._write(path, toml.dumps(data))
+                await self._write(path, content)
+                invalidate_toml(path)
         except Exception as e:
             logger.error(f"[Storage] 保存{path.name}失败: {e}")
             raise
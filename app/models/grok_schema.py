@@ -0,0 +1,42 @@
+"""Grok 上游响应结构定义 - 仅声明处理器实际读取的字段，其余字段解码时直接跳过
+
+类型无法保证的字段声明为Any，避免个别字段变化导致整行解码失败；
+错误、模型完整响应、视频进度与搜索结果等低频子对象按原样解码为dict，保留空对象为假的判断语义
+"""
+
+from typing import Any, Optional
+
+import msgspec
+
+
+class GrokUserResponse(msgspec.Struct):
+    """用户消息回显"""
+
+    model: Any = None
+
+
+class GrokResponse(msgspec.Struct, rename="camel"):
+    """单行响应主体"""
+
+    token: Any = ""
+    is_thinking: Any = False
+    message_tag: Any = None
+    tool_usage_card_id: Any = None
+    web_search_results: Any = None
+    user_response: Optional[GrokUserResponse] = None
+    model_response: Any = None
+    streaming_video_generation_response: Any = None
+    image_attachment_info: Any = None
+
+
+class GrokResult(msgspec.Struct):
+    """响应结果"""
+
+    response: Optional[GrokResponse] = None
+
+
+class GrokChunk(msgspec.Struct):
+    """上游流式响应的一行"""
+
+    result: Optional[GrokResult] = None
+    error: Any = None
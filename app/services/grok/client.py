@@ -2,12 +2,15 @@
 
 import asyncio
 import orjson
-from typing import Dict, List, Tuple, Optional
+from typing import AsyncGenerator, Dict, List, Tuple, Optional
+from fastapi import HTTPException
 from curl_cffi import requests as curl_requests
+from curl_cffi.requests import AsyncSession
 
 from app.core.config import setting
 from app.core.logger import logger
 from app.models.grok_models import Models
+from app.models.openai_schema import OpenAIChatRequest
 from app.services.grok.processer import GrokResponseProcessor
 from app.services.grok.statsig import get_dynamic_headers
 from app.services.grok.token import token_manager
@@ -22,19 +25,38 @@ TIMEOUT = 120
 BROWSER = "chrome133a"
 MAX_RETRY = 3
 MAX_UPLOADS = 5
+MAX_CLIENTS = 100
 
 
 class GrokClient:
     """Grok API 客户端"""
     
     _upload_sem = asyncio.Semaphore(MAX_UPLOADS)
+    _session: Optional[AsyncSession] = None
 
     @staticmethod
-    async def openai_to_grok(request: dict):
-        """转换OpenAI请求为Grok请求"""
-        model = request["model"]
-        content, images = GrokClient._extract_content(request["messages"])
-        stream = request.get("stream", False)
+    def _get_session() -> AsyncSession:
+        """获取共享会话（复用连接，流式数据直接由事件循环读取）
+
+        会话由所有SSO令牌共用，丢弃响应Cookie，避免一个令牌的Cookie随其他令牌的请求发出
+        """
+        if GrokClient._session is None:
+            GrokClient._session = AsyncSession(max_clients=MAX_CLIENTS, discard_cookies=True)
+        return GrokClient._session
+
+    @staticmethod
+    async def close() -> None:
+        """关闭共享会话"""
+        if GrokClient._session is not None:
+            await GrokClient._session.close()
+            GrokClient._session = None
+
+    @staticmethod
+    async def openai_to_grok(request: OpenAIChatRequest, token: Optional[str] = None):
+        """转换OpenAI请求为Grok请求（token为预检已选出的令牌，仅用于首次尝试）"""
+        model = request.model
+        content, images = GrokClient._extract_content(request.messages)
+        stream = request.stream
         
         # 获取模型信息
         info = Models.get_model_info(model)
@@ -46,16 +68,49 @@ class GrokClient:
             logger.warning("[Client] 视频模型仅支持1张图片，已截取前1张")
             images = images[:1]
         
-        return await GrokClient._retry(model, content, images, grok_model, mode, is_video, stream)
+        return await GrokClient._retry(model, content, images, grok_model, mode, is_video, stream, token)
+
+    @staticmethod
+    async def check_stream_ready(request: OpenAIChatRequest) -> str:
+        """流式请求预检（不访问上游）：校验模型并选出令牌，失败时在响应头发出前抛出，保留HTTP状态码
+
+        Returns:
+            选出的令牌，交给首次请求使用，避免重复选择
+        """
+        if not Models.is_valid_model(request.model):
+            supported = Models.get_all_model_names()
+            raise HTTPException(
+                status_code=400,
+                detail=f"不支持的模型 '{request.model}', 支持: {', '.join(supported)}"
+            )
+        return await token_manager.get_token(request.model)
+
+    @staticmethod
+    async def stream_openai_to_grok(request: OpenAIChatRequest, token: Optional[str] = None) -> AsyncGenerator[bytes, None]:
+        """流式转换OpenAI请求（首次迭代时才发起上游请求，响应头可立即下发）"""
+        try:
+            stream = await GrokClient.openai_to_grok(request, token)
+        except Exception as e:
+            # 响应头已发出，错误以SSE数据块形式返回
+            message = e.message if isinstance(e, GrokApiException) else "服务器内部错误"
+            logger.error("[Client] 流式请求失败: %s", e)
+            for frame in GrokResponseProcessor.build_error_frames(message, request.model):
+                yield frame
+            return
+
+        async for frame in stream:
+            yield frame
 
     @staticmethod
-    async def _retry(model: str, content: str, images: List[str], grok_model: str, mode: str, is_video: bool, stream: bool):
-        """重试请求"""
+    async def _retry(model: str, content: str, images: List[str], grok_model: str, mode: str, is_video: bool, stream: bool, token: Optional[str] = None):
+        """重试请求（首次尝试优先使用预选令牌，重试时重新选择）"""
         last_err = None
+        preselected = token
 
         for i in range(MAX_RETRY):
             try:
-                token = await token_manager.get_token(model)
+                token = preselected or await token_manager.get_token(model)
+                preselected = None
                 img_ids, img_uris = await GrokClient._upload(images, token)
 
                 # 视频模型创建会话
@@ -196,8 +251,7 @@ class GrokClient:
             proxies = {"http": proxy, "https": proxy} if proxy else None
             
             # 执行请求
-            response = await asyncio.to_thread(
-                curl_requests.post,
+            response = await GrokClient._get_session().post(
                 API_ENDPOINT,
                 headers=headers,
                 data=orjson.dumps(payload),
@@ -208,7 +262,7 @@ class GrokClient:
             )
             
             if response.status_code != 200:
-                GrokClient._handle_error(response, token)
+                GrokClient._handle_error(response, await response.acontent(), token)
             
             # 处理响应
             result = (GrokResponseProcessor.process_stream(response, token) if stream 
@@ -233,7 +287,7 @@ class GrokClient:
         return headers
 
     @staticmethod
-    def _handle_error(response, token: str):
+    def _handle_error(response, body: bytes, token: str):
         """处理错误"""
         if response.status_code == 403:
             msg = "您的IP被拦截，请尝试以下方法之一: 1.更换IP 2.使用代理 3.配置CF值"
@@ -241,10 +295,10 @@ class GrokClient:
             logger.warning(f"[Client] {msg}")
         else:
             try:
-                data = response.json()
+                data = orjson.loads(body)
                 msg = str(data)
             except:
-                data = response.text
+                data = body.decode("utf-8", "replace")
                 msg = data[:200] if data else "未知错误"
         
         asyncio.create_task(token_manager.record_failure(token, response.status_code, msg))
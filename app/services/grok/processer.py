@@ -1,24 +1,35 @@
 """Grok API 响应处理器 - 处理流式和非流式响应"""
 
 import orjson
+import msgspec
 import uuid
 import time
 import asyncio
-from typing import AsyncGenerator, Tuple, List
+from typing import Any, AsyncGenerator, Callable, Dict, Optional, Tuple, List
 
 from app.core.config import setting
 from app.core.exception import GrokApiException
 from app.core.logger import logger
+from app.models.grok_schema import GrokChunk, GrokResponse
 from app.models.openai_schema import (
     OpenAIChatCompletionResponse,
     OpenAIChatCompletionChoice,
-    OpenAIChatCompletionMessage,
-    OpenAIChatCompletionChunkResponse,
-    OpenAIChatCompletionChunkChoice,
-    OpenAIChatCompletionChunkMessage
+    OpenAIChatCompletionMessage
 )
 
 
+# 流式默认模型
+DEFAULT_STREAM_MODEL = "grok-4-mini-thinking-tahoe"
+
+# SSE帧
+DATA_PREFIX = b"data: "
+SSE_SUFFIX = b"\n\n"
+DONE_FRAME = b"data: [DONE]\n\n"
+
+# 上游响应解码器（按结构只解码需要的字段）
+_chunk_decoder = msgspec.json.Decoder(GrokChunk)
+
+
 class StreamTimeoutManager:
     """流式响应超时管理"""
     
@@ -26,33 +37,39 @@ class StreamTimeoutManager:
         self.chunk_timeout = chunk_timeout
         self.first_timeout = first_timeout
         self.total_timeout = total_timeout
-        self.start_time = asyncio.get_event_loop().time()
+        self._now = asyncio.get_running_loop().time
+        self.start_time = self._now()
         self.last_chunk_time = self.start_time
         self.first_received = False
+        # 预计算截止时间，仅在状态变化时更新最近截止时间
+        self._first_deadline = self.start_time + first_timeout
+        self._total_deadline = self.start_time + total_timeout if total_timeout > 0 else float("inf")
+        self.next_deadline = min(self._first_deadline, self._total_deadline)
     
     def check_timeout(self) -> Tuple[bool, str]:
-        """检查超时"""
-        now = asyncio.get_event_loop().time()
-        
-        if not self.first_received and now - self.start_time > self.first_timeout:
-            return True, f"首次响应超时({self.first_timeout}秒)"
-        
-        if self.total_timeout > 0 and now - self.start_time > self.total_timeout:
-            return True, f"总超时({self.total_timeout}秒)"
-        
-        if self.first_received and now - self.last_chunk_time > self.chunk_timeout:
-            return True, f"数据块超时({self.chunk_timeout}秒)"
-        
+        """检查超时（常规路径只做一次比较）"""
+        now = self._now()
+        if now > self.next_deadline:
+            return True, self._which_timeout(now)
         return False, ""
     
+    def _which_timeout(self, now: float) -> str:
+        """确定超时类型"""
+        if now > self._total_deadline:
+            return f"总超时({self.total_timeout}秒)"
+        if not self.first_received:
+            return f"首次响应超时({self.first_timeout}秒)"
+        return f"数据块超时({self.chunk_timeout}秒)"
+    
     def mark_received(self):
         """标记收到数据"""
-        self.last_chunk_time = asyncio.get_event_loop().time()
+        self.last_chunk_time = self._now()
         self.first_received = True
+        self.next_deadline = min(self._total_deadline, self.last_chunk_time + self.chunk_timeout)
     
     def duration(self) -> float:
         """获取总耗时"""
-        return asyncio.get_event_loop().time() - self.start_time
+        return self._now() - self.start_time
 
 
 class GrokResponseProcessor:
@@ -67,20 +84,22 @@ class GrokResponseProcessor:
                 if not chunk:
                     continue
 
-                data = orjson.loads(chunk)
+                data = _chunk_decoder.decode(chunk)
 
                 # 错误检查
-                if error := data.get("error"):
+                if error := data.error:
                     raise GrokApiException(
                         f"API错误: {error.get('message', '未知错误')}",
                         "API_ERROR",
                         {"code": error.get("code")}
                     )
 
-                grok_resp = data.get("result", {}).get("response", {})
+                grok_resp = data.result.response if data.result else None
+                if grok_resp is None:
+                    continue
                 
                 # 视频响应
-                if video_resp := grok_resp.get("streamingVideoGenerationResponse"):
+                if video_resp := grok_resp.streaming_video_generation_response:
                     if video_url := video_resp.get("videoUrl"):
                         content = await GrokResponseProcessor._build_video_content(video_url, auth_token)
                         result = GrokResponseProcessor._build_response(content, model or "grok-imagine-0.9")
@@ -89,7 +108,7 @@ class GrokResponseProcessor:
                         return result
 
                 # 模型响应
-                model_response = grok_resp.get("modelResponse")
+                model_response = grok_resp.model_response
                 if not model_response:
                     continue
 
@@ -97,8 +116,9 @@ class GrokResponseProcessor:
                     raise GrokApiException(f"模型错误: {error_msg}", "MODEL_ERROR")
 
                 # 构建内容
-                content = model_response.get("message", "")
-                model_name = model_response.get("model")
+                content = model_response.get("message") or ""
+                # 上游未返回模型名时回退为请求的模型（构建响应时不再校验）
+                model_name = model_response.get("model") or model
 
                 # 处理图片
                 if images := model_response.get("generatedImageUrls"):
@@ -112,89 +132,108 @@ class GrokResponseProcessor:
 
             raise GrokApiException("无响应数据", "NO_RESPONSE")
 
-        except orjson.JSONDecodeError as e:
+        except msgspec.DecodeError as e:
             logger.error(f"[Processor] JSON解析失败: {e}")
             raise GrokApiException(f"JSON解析失败: {e}", "JSON_ERROR") from e
         except Exception as e:
             logger.error(f"[Processor] 处理错误: {type(e).__name__}: {e}")
             raise GrokApiException(f"响应处理错误: {e}", "STREAM_ERROR") from e
         finally:
-            if not response_closed and hasattr(response, 'close'):
+            if not response_closed:
                 try:
                     response.close()
+                except AttributeError:
+                    pass
                 except Exception as e:
                     logger.warning(f"[Processor] 关闭响应失败: {e}")
 
     @staticmethod
-    async def process_stream(response, auth_token: str) -> AsyncGenerator[str, None]:
+    async def process_stream(response, auth_token: str) -> AsyncGenerator[bytes, None]:
         """处理流式响应"""
         is_image = False
         is_thinking = False
         thinking_finished = False
         model = None
-        raw_filtered_tags = setting.grok_config.get("filtered_tags", "")
-        if isinstance(raw_filtered_tags, str):
-            filtered_tags = [tag.strip() for tag in raw_filtered_tags.split(",") if tag.strip()]
-        else:
-            filtered_tags = [str(tag).strip() for tag in raw_filtered_tags if str(tag).strip()]
         video_progress_started = False
         last_video_progress = -1
         response_closed = False
-        show_thinking = setting.grok_config.get("show_thinking", True)
+        # 过滤标签匹配器与流式参数在配置加载时预解析
+        tag_matcher = setting.tag_matcher
+        show_thinking = setting.show_thinking
 
+        chunk_timeout, first_timeout, total_timeout = setting.stream_timeouts
         timeout_mgr = StreamTimeoutManager(
-            chunk_timeout=setting.grok_config.get("stream_chunk_timeout", 120),
-            first_timeout=setting.grok_config.get("stream_first_response_timeout", 30),
-            total_timeout=setting.grok_config.get("stream_total_timeout", 600)
+            chunk_timeout=chunk_timeout,
+            first_timeout=first_timeout,
+            total_timeout=total_timeout
         )
 
-        def make_chunk(content: str, finish: str = None):
-            chunk_data = OpenAIChatCompletionChunkResponse(
-                id=f"chatcmpl-{uuid.uuid4()}",
-                created=int(time.time()),
-                model=model or "grok-4-mini-thinking-tahoe",
-                choices=[OpenAIChatCompletionChunkChoice(
-                    index=0,
-                    delta=OpenAIChatCompletionChunkMessage(
-                        role="assistant",
-                        content=content
-                    ) if content else {},
-                    finish_reason=finish
-                )]
-            )
-            return f"data: {chunk_data.model_dump_json()}\n\n"
+        build_chunk = GrokResponseProcessor._chunk_builder()
+
+        def make_chunk(content: str, finish: str = None) -> bytes:
+            return build_chunk(content, model, finish)
+
+        # 文本合并：上游同批到达的Token合并为一个数据块，就绪队列清空或超出窗口时下发
+        loop = asyncio.get_running_loop()
+        coalesce_window = setting.stream_coalesce_window
+        pending: List[str] = []
+        flush_deadline = 0.0
+
+        def flush_pending() -> bytes:
+            content = "".join(pending)
+            pending.clear()
+            return make_chunk(content)
+
+        lines: asyncio.Queue = asyncio.Queue()
+        pump = asyncio.create_task(GrokResponseProcessor._pump_lines(response, lines))
 
         try:
-            async for chunk in GrokResponseProcessor._iter_response_lines(response):
+            while True:
+                if pending and lines.empty():
+                    yield flush_pending()
+
+                chunk = await lines.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+
                 is_timeout, timeout_msg = GrokResponseProcessor._handle_timeout_check(timeout_mgr)
                 if is_timeout:
                     logger.warning(f"[Processor] {timeout_msg}")
+                    if pending:
+                        yield flush_pending()
                     yield make_chunk("", "stop")
-                    yield "data: [DONE]\n\n"
+                    yield DONE_FRAME
                     return
 
-                logger.debug(f"[Processor] 收到数据块: {len(chunk)} bytes")
-                if not chunk:
-                    continue
+                logger.debug("[Processor] 收到数据块: %d bytes", len(chunk))
+                # 仅解析JSON行（兼容data:前缀），跳过空行、保活与SSE注释
+                if chunk[:1] != b"{":
+                    if not chunk.startswith(b"data: {"):
+                        continue
+                    chunk = chunk[len(DATA_PREFIX):]
 
                 try:
-                    data = orjson.loads(chunk)
+                    data = _chunk_decoder.decode(chunk)
 
-                    if error := data.get("error"):
+                    if error := data.error:
                         error_msg = error.get('message', "未知错误")
                         logger.error(f"[Processor] API错误: {error_msg}")
+                        if pending:
+                            yield flush_pending()
                         yield make_chunk(f"Error: {error_msg}", "stop")
-                        yield "data: [DONE]\n\n"
+                        yield DONE_FRAME
                         return
 
-                    grok_resp = data.get("result", {}).get("response", {})
-                    if not grok_resp:
+                    grok_resp = data.result.response if data.result else None
+                    if grok_resp is None:
                         continue
 
                     timeout_mgr.mark_received()
 
-                    if user_resp := grok_resp.get("userResponse"):
-                        if m := user_resp.get("model"):
+                    if user_resp := grok_resp.user_response:
+                        if m := user_resp.model:
                             model = m
 
                     handled_video, last_video_progress, video_progress_started, video_chunks = await GrokResponseProcessor._handle_video_progress(
@@ -205,6 +244,8 @@ class GrokResponseProcessor:
                         video_progress_started,
                         show_thinking
                     )
+                    if video_chunks and pending:
+                        yield flush_pending()
                     for chunk_text in video_chunks:
                         yield chunk_text
                     if handled_video:
@@ -216,6 +257,8 @@ class GrokResponseProcessor:
                         make_chunk,
                         is_image
                     )
+                    if image_chunks and pending:
+                        yield flush_pending()
                     for chunk_text in image_chunks:
                         yield chunk_text
                     if should_close_stream:
@@ -223,42 +266,84 @@ class GrokResponseProcessor:
                     if image_handled:
                         continue
 
-                    token = grok_resp.get("token", "")
-                    text_chunks, is_thinking, thinking_finished = GrokResponseProcessor._handle_thinking_block(
+                    token = grok_resp.token
+                    texts, is_thinking, thinking_finished = GrokResponseProcessor._handle_thinking_block(
                         grok_resp,
                         token,
-                        filtered_tags,
+                        tag_matcher,
                         show_thinking,
                         thinking_finished,
-                        is_thinking,
-                        make_chunk
+                        is_thinking
                     )
-                    for chunk_text in text_chunks:
-                        yield chunk_text
-
-                except (orjson.JSONDecodeError, UnicodeDecodeError) as e:
+                    if texts:
+                        if not pending:
+                            flush_deadline = loop.time() + coalesce_window
+                        pending.extend(texts)
+                        if loop.time() >= flush_deadline:
+                            yield flush_pending()
+
+                except msgspec.DecodeError as e:
                     logger.warning(f"[Processor] 解析失败: {e}")
                     continue
                 except Exception as e:
                     logger.warning(f"[Processor] 处理出错: {e}")
                     continue
 
+            if pending:
+                yield flush_pending()
             yield make_chunk("", "stop")
-            yield "data: [DONE]\n\n"
+            yield DONE_FRAME
             logger.info(f"[Processor] 流式完成，耗时: {timeout_mgr.duration():.2f}秒")
 
         except Exception as e:
             logger.error(f"[Processor] 严重错误: {e}")
+            if pending:
+                yield flush_pending()
             yield make_chunk(f"处理错误: {e}", "error")
-            yield "data: [DONE]\n\n"
+            yield DONE_FRAME
         finally:
-            if not response_closed and hasattr(response, "close"):
+            pump.cancel()
+            if not response_closed:
                 try:
                     response.close()
                     logger.debug("[Processor] 响应已关闭")
+                except AttributeError:
+                    pass
                 except Exception as e:
                     logger.warning(f"[Processor] 关闭失败: {e}")
 
+    @staticmethod
+    def build_error_frames(message: str, model: str = None) -> List[bytes]:
+        """构建错误结束帧（错误块 + [DONE]）"""
+        build_chunk = GrokResponseProcessor._chunk_builder()
+        return [build_chunk(f"Error: {message}", model, "stop"), DONE_FRAME]
+
+    @staticmethod
+    def _chunk_builder() -> Callable[..., bytes]:
+        """创建SSE数据块构建器（单次流内复用同一模板，id与创建时间保持一致）"""
+        template: Dict[str, Any] = {
+            "id": f"chatcmpl-{uuid.uuid4()}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": DEFAULT_STREAM_MODEL,
+            "system_fingerprint": None,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": None}]
+        }
+        choice = template["choices"][0]
+        delta = {"role": "assistant", "content": ""}
+
+        def build_chunk(content: str, model: str = None, finish: str = None) -> bytes:
+            template["model"] = model or DEFAULT_STREAM_MODEL
+            if content:
+                delta["content"] = content
+                choice["delta"] = delta
+            else:
+                choice["delta"] = {}
+            choice["finish_reason"] = finish
+            return DATA_PREFIX + orjson.dumps(template) + SSE_SUFFIX
+
+        return build_chunk
+
     @staticmethod
     def _handle_timeout_check(timeout_mgr: StreamTimeoutManager) -> Tuple[bool, str]:
         """处理超时检查"""
@@ -266,19 +351,19 @@ class GrokResponseProcessor:
 
     @staticmethod
     async def _handle_video_progress(
-        grok_resp: dict,
+        grok_resp: GrokResponse,
         auth_token: str,
         make_chunk,
         last_video_progress: int,
         video_progress_started: bool,
         show_thinking: bool
-    ) -> Tuple[bool, int, bool, List[str]]:
+    ) -> Tuple[bool, int, bool, List[bytes]]:
         """处理视频生成进度与结果"""
-        video_resp = grok_resp.get("streamingVideoGenerationResponse")
+        video_resp = grok_resp.streaming_video_generation_response
         if not video_resp:
             return False, last_video_progress, video_progress_started, []
 
-        chunks: List[str] = []
+        chunks: List[bytes] = []
         progress = video_resp.get("progress", 0)
         v_url = video_resp.get("videoUrl")
         updated_progress = last_video_progress
@@ -305,32 +390,26 @@ class GrokResponseProcessor:
 
     @staticmethod
     async def _handle_image_attachment(
-        grok_resp: dict,
+        grok_resp: GrokResponse,
         auth_token: str,
         make_chunk,
         is_image: bool
-    ) -> Tuple[bool, bool, bool, List[str]]:
+    ) -> Tuple[bool, bool, bool, List[bytes]]:
         """处理图像流数据"""
-        updated_is_image = is_image or bool(grok_resp.get("imageAttachmentInfo"))
-        chunks: List[str] = []
+        updated_is_image = is_image or bool(grok_resp.image_attachment_info)
+        chunks: List[bytes] = []
         should_close = False
 
         if not updated_is_image:
             return False, False, updated_is_image, chunks
 
-        model_resp = grok_resp.get("modelResponse")
-        token = grok_resp.get("token", "")
+        model_resp = grok_resp.model_response
+        token = grok_resp.token
 
         if model_resp:
-            content_lines = []
-            for img in model_resp.get("generatedImageUrls", []):
-                try:
-                    content_lines.append(f"![Generated Image](https://assets.grok.com/{img})")
-                except Exception as e:
-                    logger.warning(f"[Processor] 处理图片失败: {e}")
-                    content_lines.append(f"![Generated Image](https://assets.grok.com/{img})")
-
-            content = "\n".join(content_lines).strip()
+            content = "\n".join(
+                f"![Generated Image](https://assets.grok.com/{img})" for img in model_resp.get("generatedImageUrls") or ()
+            )
             chunks.append(make_chunk(content, "stop"))
             should_close = True
         elif token:
@@ -340,15 +419,14 @@ class GrokResponseProcessor:
 
     @staticmethod
     def _handle_thinking_block(
-        grok_resp: dict,
+        grok_resp: GrokResponse,
         token: str,
-        filtered_tags: List[str],
+        tag_matcher: Optional[Callable[[str], Any]],
         show_thinking: bool,
         thinking_finished: bool,
-        is_thinking: bool,
-        make_chunk
+        is_thinking: bool
     ) -> Tuple[List[str], bool, bool]:
-        """处理对话Token与思考状态"""
+        """处理对话Token与思考状态（返回待下发文本，由调用方合并成块）"""
         chunks: List[str] = []
 
         if isinstance(token, list):
@@ -357,15 +435,15 @@ class GrokResponseProcessor:
         if not token:
             return chunks, is_thinking, thinking_finished
 
-        if token and any(tag in token for tag in filtered_tags):
+        if tag_matcher and tag_matcher(token) is not None:
             return chunks, is_thinking, thinking_finished
 
-        current_is_thinking = grok_resp.get("isThinking", False)
+        current_is_thinking = bool(grok_resp.is_thinking)
         if thinking_finished and current_is_thinking:
             return chunks, is_thinking, thinking_finished
 
-        if grok_resp.get("toolUsageCardId"):
-            if web_search := grok_resp.get("webSearchResults"):
+        if grok_resp.tool_usage_card_id:
+            if web_search := grok_resp.web_search_results:
                 if current_is_thinking:
                     if show_thinking:
                         for result in web_search.get("results", []):
@@ -382,7 +460,7 @@ class GrokResponseProcessor:
             else:
                 return chunks, is_thinking, thinking_finished
 
-        message_tag = grok_resp.get("messageTag")
+        message_tag = grok_resp.message_tag
         content = token
         if message_tag == "header":
             content = f"\n\n{token}\n\n"
@@ -401,19 +479,24 @@ class GrokResponseProcessor:
             should_skip = True
 
         if not should_skip:
-            chunks.append(make_chunk(content))
+            chunks.append(content)
 
         return chunks, current_is_thinking, thinking_finished
 
     @staticmethod
-    async def _iter_response_lines(response):
-        """在后台线程中迭代响应行，避免阻塞事件循环"""
-        iterator = response.iter_lines()
-        while True:
-            chunk = await asyncio.to_thread(next, iterator, None)
-            if chunk is None:
-                break
-            yield chunk
+    def _iter_response_lines(response):
+        """异步迭代响应行（事件循环直接等待数据，无需逐行切换线程）"""
+        return response.aiter_lines()
+
+    @staticmethod
+    async def _pump_lines(response, lines: asyncio.Queue) -> None:
+        """读取上游响应行并放入就绪队列（结束放入None，异常原样放入）"""
+        try:
+            async for line in GrokResponseProcessor._iter_response_lines(response):
+                lines.put_nowait(line)
+            lines.put_nowait(None)
+        except Exception as e:
+            lines.put_nowait(e)
 
     @staticmethod
     async def _build_video_content(video_url: str, auth_token: str) -> str:
@@ -422,29 +505,17 @@ class GrokResponseProcessor:
         full_url = f"https://assets.grok.com/{video_url}"
         return f'<video src="{full_url}" controls="controls" width="500" height="300"></video>\\n'
 
-    @staticmethod
-    async def _append_images(content: str, images: list, auth_token: str) -> str:
-        """追加图片到内容"""
-        for img in images:
-            try:
-                content += f"\\n![Generated Image](https://assets.grok.com/{img})"
-            except Exception as e:
-                logger.warning(f"[Processor] 处理图片失败: {e}")
-                content += f"\\n![Generated Image](https://assets.grok.com/{img})"
-        
-        return content
-
     @staticmethod
     def _build_response(content: str, model: str) -> OpenAIChatCompletionResponse:
-        """构建响应对象"""
-        return OpenAIChatCompletionResponse(
+        """构建响应对象（字段均由服务端生成，跳过校验）"""
+        return OpenAIChatCompletionResponse.model_construct(
             id=f"chatcmpl-{uuid.uuid4()}",
             object="chat.completion",
             created=int(time.time()),
             model=model,
-            choices=[OpenAIChatCompletionChoice(
+            choices=[OpenAIChatCompletionChoice.model_construct(
                 index=0,
-                message=OpenAIChatCompletionMessage(
+                message=OpenAIChatCompletionMessage.model_construct(
                     role="assistant",
                     content=content
                 ),
@@ -4,6 +4,7 @@ import base64
 import random
 import string
 import uuid
+from functools import lru_cache
 from typing import Dict
 
 from app.core.logger import logger
@@ -52,6 +53,14 @@ def _generate_statsig_id() -> str:
     return base64.b64encode(msg.encode()).decode()
 
 
+@lru_cache(maxsize=16)
+def _base_headers(pathname: str) -> Dict[str, str]:
+    """按路径缓存静态请求头（仅读，使用时需复制）"""
+    headers = BASE_HEADERS.copy()
+    headers["Content-Type"] = "text/plain;charset=UTF-8" if "upload-file" in pathname else "application/json"
+    return headers
+
+
 def get_dynamic_headers(pathname: str = "/rest/app-chat/conversations/new") -> Dict[str, str]:
     """获取请求头
     
@@ -64,17 +73,16 @@ def get_dynamic_headers(pathname: str = "/rest/app-chat/conversations/new") -> D
     # 获取或生成statsig-id
     if setting.grok_config.get("dynamic_statsig", False):
         statsig_id = _generate_statsig_id()
-        logger.debug(f"[Statsig] 动态生成: {statsig_id}")
+        logger.debug("[Statsig] 动态生成: %s", statsig_id)
     else:
         statsig_id = setting.grok_config.get("x_statsig_id")
         if not statsig_id:
             raise ValueError("配置文件中未设置 x_statsig_id")
-        logger.debug(f"[Statsig] 使用固定值: {statsig_id}")
+        logger.debug("[Statsig] 使用固定值: %s", statsig_id)
 
-    # 构建请求头
-    headers = BASE_HEADERS.copy()
+    # 构建请求头（statsig与request-id每次请求独立生成，不参与缓存）
+    headers = _base_headers(pathname).copy()
     headers["x-statsig-id"] = statsig_id
     headers["x-xai-request-id"] = str(uuid.uuid4())
-    headers["Content-Type"] = "text/plain;charset=UTF-8" if "upload-file" in pathname else "application/json"
 
     return headers
\ No newline at end of file
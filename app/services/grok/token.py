@@ -3,7 +3,6 @@
 import copy
 import orjson
 import asyncio
-import aiofiles
 from pathlib import Path
 from curl_cffi.requests import AsyncSession
 from typing import Dict, Any, Optional, Tuple
@@ -12,6 +11,7 @@ from app.models.grok_models import TokenType, Models
 from app.core.exception import GrokApiException
 from app.core.logger import logger
 from app.core.config import setting
+from app.core.storage import write_file
 from app.services.grok.statsig import get_dynamic_headers
 
 
@@ -79,8 +79,7 @@ class GrokTokenManager:
 
             if not self._storage:
                 async with self._file_lock:
-                    async with aiofiles.open(self.token_file, "w", encoding="utf-8") as f:
-                        await f.write(orjson.dumps(data_snapshot, option=orjson.OPT_INDENT_2).decode())
+                    await write_file(self.token_file, orjson.dumps(data_snapshot, option=orjson.OPT_INDENT_2))
             else:
                 await self._storage.save_tokens(data_snapshot)
         except IOError as e:
@@ -1,10 +1,12 @@
 """图片上传管理器 - 支持Base64和URL图片上传"""
 
 import base64
+import asyncio
 import ipaddress
 import re
 import socket
-from typing import Tuple, Optional, Union
+import time
+from typing import Dict, Tuple, Optional, Union
 from urllib.parse import urlparse
 from curl_cffi.requests import AsyncSession
 
@@ -21,13 +23,12 @@ BROWSER = "chrome133a"
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_MIME_PREFIX = "image/"
 DISALLOWED_HOSTS = {"localhost", "127.0.0.1", "0.0.0.0"}
-DISALLOWED_NETWORKS = [
-    ipaddress.ip_network("10.0.0.0/8"),
-    ipaddress.ip_network("172.16.0.0/12"),
-    ipaddress.ip_network("192.168.0.0/16"),
-    ipaddress.ip_network("169.254.0.0/16"),
-]
 IPAddress = Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+DNS_CACHE_SIZE = 1024
+DNS_CACHE_TTL = 300  # 秒
+
+# 内网域名缓存 {主机名: 过期时间}（仅缓存拒绝结果；放行的域名每次重新解析，避免DNS重绑定绕过校验）
+_dns_cache: Dict[str, float] = {}
 
 # MIME类型
 MIME_TYPES = {
@@ -36,11 +37,28 @@ MIME_TYPES = {
 }
 DEFAULT_MIME = "image/jpeg"
 DEFAULT_EXT = "jpg"
+DATA_URI_RE = re.compile(r"data:([a-zA-Z0-9]+/[a-zA-Z0-9-.+]+);base64,")
 
 
 class ImageUploadManager:
     """图片上传管理器"""
 
+    _session: Optional[AsyncSession] = None
+
+    @staticmethod
+    def _get_session() -> AsyncSession:
+        """获取共享会话（上传与下载复用连接，丢弃响应Cookie避免跨令牌与第三方站点串用）"""
+        if ImageUploadManager._session is None:
+            ImageUploadManager._session = AsyncSession(discard_cookies=True)
+        return ImageUploadManager._session
+
+    @staticmethod
+    async def close() -> None:
+        """关闭共享会话"""
+        if ImageUploadManager._session is not None:
+            await ImageUploadManager._session.close()
+            ImageUploadManager._session = None
+
     @staticmethod
     async def upload(image_input: str, auth_token: str) -> Tuple[str, str]:
         """上传图片（支持Base64或URL）
@@ -54,7 +72,11 @@ class ImageUploadManager:
                 buffer, mime = await ImageUploadManager._download(image_input)
                 filename, _ = ImageUploadManager._get_info("", mime)
             else:
-                buffer = image_input.split(",")[1] if "data:image" in image_input else image_input
+                buffer = image_input
+                if image_input.startswith("data:image"):
+                    # 逗号只会出现在头部，限定范围查找，避免扫描整段Base64
+                    comma = image_input.find(",", 10, 256)
+                    buffer = image_input[comma + 1:] if comma >= 0 else ""
                 filename, mime = ImageUploadManager._get_info(image_input)
 
             if not buffer:
@@ -81,31 +103,30 @@ class ImageUploadManager:
             proxies = {"http": proxy, "https": proxy} if proxy else None
 
             # 上传
-            async with AsyncSession() as session:
-                response = await session.post(
-                    UPLOAD_API,
-                    headers=headers,
-                    json=data,
-                    impersonate=BROWSER,
-                    timeout=TIMEOUT,
-                    proxies=proxies,
+            response = await ImageUploadManager._get_session().post(
+                UPLOAD_API,
+                headers=headers,
+                json=data,
+                impersonate=BROWSER,
+                timeout=TIMEOUT,
+                proxies=proxies,
+            )
+
+            if response.status_code != 200:
+                raise GrokApiException(
+                    f"图片上传失败，状态码: {response.status_code}",
+                    "API_ERROR",
+                    context={"status": response.status_code}
                 )
 
-                if response.status_code != 200:
-                    raise GrokApiException(
-                        f"图片上传失败，状态码: {response.status_code}",
-                        "API_ERROR",
-                        context={"status": response.status_code}
-                    )
-
-                result = response.json()
-                file_id = result.get("fileMetadataId")
-                file_uri = result.get("fileUri")
-                if not file_id or not file_uri:
-                    raise GrokApiException("上传返回异常，缺少文件信息", "API_ERROR")
+            result = response.json()
+            file_id = result.get("fileMetadataId")
+            file_uri = result.get("fileUri")
+            if not file_id or not file_uri:
+                raise GrokApiException("上传返回异常，缺少文件信息", "API_ERROR")
 
-                logger.debug(f"[Upload] 成功，ID: {file_id}")
-                return file_id, file_uri
+            logger.debug(f"[Upload] 成功，ID: {file_id}")
+            return file_id, file_uri
 
         except GrokApiException:
             raise
@@ -130,18 +151,19 @@ class ImageUploadManager:
             (base64_string, mime_type) 元组
         """
         try:
-            ImageUploadManager._validate_https_url(url)
+            await ImageUploadManager._validate_https_url(url)
 
             proxy = setting.grok_config.get("proxy_url", "")
             proxies = {"http": proxy, "https": proxy} if proxy else None
 
-            async with AsyncSession() as session:
-                response = await session.get(
-                    url,
-                    timeout=5,
-                    proxies=proxies,
-                    impersonate=BROWSER,
-                )
+            response = await ImageUploadManager._get_session().get(
+                url,
+                timeout=5,
+                proxies=proxies,
+                impersonate=BROWSER,
+                stream=True,
+            )
+            try:
                 response.raise_for_status()
 
                 content_length = response.headers.get('content-length')
@@ -151,17 +173,24 @@ class ImageUploadManager:
                 except ValueError:
                     pass
 
-                content = response.content
-                if len(content) > MAX_FILE_SIZE:
-                    raise GrokApiException("文件过大", "FILE_TOO_LARGE")
-
                 content_type = response.headers.get('content-type', DEFAULT_MIME)
                 mime_type = content_type.split(';')[0].strip().lower() if content_type else DEFAULT_MIME
                 if not mime_type.startswith(ALLOWED_MIME_PREFIX):
                     raise GrokApiException("仅允许图片类型", "INVALID_CONTENT_TYPE")
 
-                b64 = base64.b64encode(content).decode()
-                return b64, mime_type
+                # 边下载边计数，超限立即中止，不等待完整响应体
+                chunks, total = [], 0
+                async for chunk in response.aiter_content():
+                    total += len(chunk)
+                    if total > MAX_FILE_SIZE:
+                        raise GrokApiException("文件过大", "FILE_TOO_LARGE")
+                    chunks.append(chunk)
+            finally:
+                response.close()
+                await response.aclose()
+
+            b64 = base64.b64encode(b"".join(chunks)).decode("ascii")
+            return b64, mime_type
         except GrokApiException:
             raise
         except Exception as e:
@@ -169,7 +198,7 @@ class ImageUploadManager:
             raise GrokApiException("图片下载失败", "API_ERROR") from e
 
     @staticmethod
-    def _validate_https_url(url: str) -> None:
+    async def _validate_https_url(url: str) -> None:
         """验证URL协议与主机是否合法"""
         parsed = urlparse(url)
         scheme = (parsed.scheme or "").lower()
@@ -177,11 +206,11 @@ class ImageUploadManager:
             raise GrokApiException("仅允许HTTPS地址", "INVALID_URL")
 
         hostname = parsed.hostname.lower()
-        if ImageUploadManager._is_disallowed_host(hostname):
+        if await ImageUploadManager._is_disallowed_host(hostname):
             raise GrokApiException("禁止访问内网地址", "INVALID_URL")
 
     @staticmethod
-    def _is_disallowed_host(hostname: str) -> bool:
+    async def _is_disallowed_host(hostname: str) -> bool:
         """检查主机是否在黑名单或私网段"""
         if hostname in DISALLOWED_HOSTS:
             return True
@@ -190,13 +219,19 @@ class ImageUploadManager:
             ip_obj = ipaddress.ip_address(hostname)
             return ImageUploadManager._ip_in_disallowed_network(ip_obj)
         except ValueError:
-            return ImageUploadManager._resolve_and_validate(hostname)
+            return await ImageUploadManager._resolve_and_validate(hostname)
 
     @staticmethod
-    def _resolve_and_validate(hostname: str) -> bool:
-        """解析域名并判断是否落在内网"""
+    async def _resolve_and_validate(hostname: str) -> bool:
+        """解析域名并判断是否落在内网（异步解析，仅缓存拒绝结果）"""
+        now = time.monotonic()
+        if expires := _dns_cache.get(hostname):
+            if expires > now:
+                return True
+            del _dns_cache[hostname]
+
         try:
-            addr_info = socket.getaddrinfo(hostname, None)
+            addr_info = await asyncio.get_running_loop().getaddrinfo(hostname, None)
         except socket.gaierror:
             return False
 
@@ -207,18 +242,23 @@ class ImageUploadManager:
             except ValueError:
                 continue
             if ImageUploadManager._ip_in_disallowed_network(ip_obj):
+                # 超出容量时淘汰最早写入的条目
+                if len(_dns_cache) >= DNS_CACHE_SIZE:
+                    del _dns_cache[next(iter(_dns_cache))]
+                _dns_cache[hostname] = now + DNS_CACHE_TTL
                 return True
         return False
 
     @staticmethod
     def _ip_in_disallowed_network(ip_obj: IPAddress) -> bool:
-        if ip_obj.is_loopback or ip_obj.is_private or ip_obj.is_link_local:
-            return True
-
-        for network in DISALLOWED_NETWORKS:
-            if ip_obj.version == network.version and ip_obj in network:
-                return True
-        return False
+        """检查IP是否为回环/私网/链路本地/保留/组播地址（is_private已覆盖RFC1918与169.254/16）"""
+        return (
+            ip_obj.is_loopback
+            or ip_obj.is_private
+            or ip_obj.is_link_local
+            or ip_obj.is_reserved
+            or ip_obj.is_multicast
+        )
 
     @staticmethod
     def _get_info(image_data: str, mime_type: Optional[str] = None) -> Tuple[str, str]:
@@ -236,8 +276,8 @@ class ImageUploadManager:
         mime = DEFAULT_MIME
         ext = DEFAULT_EXT
 
-        if "data:image" in image_data:
-            if match := re.search(r"data:([a-zA-Z0-9]+/[a-zA-Z0-9-.+]+);base64,", image_data):
+        if image_data.startswith("data:image"):
+            if match := DATA_URI_RE.match(image_data):
                 mime = match.group(1)
                 ext = mime.split("/")[1]
 
@@ -2,11 +2,14 @@
 
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from app.core.logger import logger
 from app.core.exception import register_exception_handlers
 from app.core.storage import storage_manager
 from app.core.config import setting
 from app.services.grok.token import token_manager
+from app.services.grok.client import GrokClient
+from app.services.grok.upload import ImageUploadManager
 from app.api.v1.chat import router as chat_router
 from app.api.v1.models import router as models_router
 
@@ -42,8 +45,11 @@ async def lifespan(app: FastAPI):
     finally:
         # --- 关闭过程 ---
         # 关闭核心服务
+        await GrokClient.close()
+        await ImageUploadManager.close()
         await storage_manager.close()
         logger.info("[Grok2API] 应用关闭成功")
+        logger.close()
 
 
 # 初始化日志
@@ -54,7 +60,8 @@ app = FastAPI(
     title="Grok2API",
     description="Grok API 转换服务",
     version="1.3.1",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # 注册全局异常处理器